@@ -1,11 +1,17 @@
 import argparse
 import asyncio
+import json
 import re
 import platform
+import time
 from dataclasses import dataclass
+from datetime import datetime
 
 from scans import *
 
+# Columns written in the XLSX report
+REPORT_KEYS = ["id", "name", "status", "comment"]
+
 
 def scanner(scan, psaudit, mcaudit, azaudit) -> dict:
     """This function runs the command of the scan and returns the output
@@ -25,7 +31,7 @@ def scanner(scan, psaudit, mcaudit, azaudit) -> dict:
         case "az":  # if its azure command
             ### Runs the command and if it fails then it's not applicable and adds the reason in the comment key of the scan dict
             try:
-                output = azaudit.az_run(scan["command"])
+                output = azaudit.az_run(scan["command"], scan.get("shard_resources"))
             except Exception as e:
                 scan["comment"] = str(e)
                 output = None
@@ -55,7 +61,17 @@ def get_result(output, scan, secure_score):
                 scan["status"] = str(re.search(check, output.decode()) is not None)
 
         case "az":
-            if output is None or (not output and applies_if_empty == "False"):
+            if isinstance(output, ResourceTable):
+                statuses = output.grade(check, applies_if_empty)
+                scan["resources"] = [
+                    {"resource": resource, "status": status, "output_hash": output_hash}
+                    for resource, status, output_hash in zip(
+                        output.resources, statuses, output.fingerprints()
+                    )
+                ]
+                scan["status"] = ResourceTable.aggregate(statuses, applies_if_empty)
+                add_resource_errors(output, scan)
+            elif output is None or (not output and applies_if_empty == "False"):
                 scan["status"] = "NotApplicable"
             elif check == "None":
                 scan["status"] = "True"
@@ -87,11 +103,252 @@ def get_result(output, scan, secure_score):
     return scan
 
 
+def get_diff_result(output, scan, previous) -> bool:
+    """This function reuses the verdict of the previous run when the output of the scan didn't change.
+    For the scans that run against multiple resources, only the resources whose output changed are graded again.
+
+    Args:
+            output: Output of the scan
+            scan (dict): The scan
+            previous (dict): The verdict of the same scan in the previous run, or None
+
+    Returns:
+            bool: True if the verdict was reused, False if the scan has to go through get_result()
+    """
+    if previous is None or "Error" == scan.get("status", None):
+        return False
+
+    if not isinstance(output, ResourceTable):
+        if fingerprint(output) != previous["output_hash"]:
+            return False
+        scan["status"] = previous["status"]
+        print_audit_element(scan["id"], scan["name"], scan["status"])
+        return True
+
+    known = {resource["resource"]: resource for resource in previous["resources"]}
+    hashes = output.fingerprints()
+    changed = [
+        index
+        for index, (resource, output_hash, failure) in enumerate(
+            zip(output.resources, hashes, output.errors)
+        )
+        if failure is not None
+        or resource not in known
+        or known[resource]["output_hash"] != output_hash
+    ]
+    if not output or len(changed) == len(output):
+        return False
+
+    statuses = [known.get(resource, {}).get("status") for resource in output.resources]
+    regraded = output.select(changed).grade(scan["check"], scan["applies_if_empty"])
+    for index, status in zip(changed, regraded):
+        statuses[index] = status
+
+    scan["resources"] = [
+        {"resource": resource, "status": status, "output_hash": output_hash}
+        for resource, status, output_hash in zip(output.resources, statuses, hashes)
+    ]
+    scan["status"] = ResourceTable.aggregate(statuses, scan["applies_if_empty"])
+    add_resource_errors(output, scan)
+    print_audit_element(scan["id"], scan["name"], scan["status"])
+    return True
+
+
+def add_resource_errors(output, scan):
+    """This function adds why the command failed for some resources to the comment of the scan"""
+    failures = [
+        f"{resource}: {failure}"
+        for resource, failure in zip(output.resources, output.errors)
+        if failure is not None
+    ]
+    scan["comment"] = " | ".join(filter(None, [scan.get("comment")] + failures))
+
+
+def drift_report(objects, verdicts) -> list:
+    """This function lists the scans, and their resources, whose status changed since the previous run
+
+    Args:
+            objects (list): The graded scans
+            verdicts (dict): The verdicts of the previous run, by verdict_key()
+
+    Returns:
+            list: The scans that drifted, with only the resources that drifted or were removed
+    """
+    drifts = []
+
+    for scan in objects:
+        previous = verdicts.get(verdict_key(scan))
+        previous_status = previous["status"] if previous else "New"
+        known = {
+            resource["resource"]: resource["status"]
+            for resource in (previous["resources"] if previous else [])
+        }
+        current = {resource["resource"] for resource in scan.get("resources", [])}
+        resources = [
+            resource
+            for resource in scan.get("resources", [])
+            if known.get(resource["resource"], "New") != resource["status"]
+        ] + [
+            {"resource": resource, "status": "Removed", "output_hash": None}
+            for resource in known
+            if resource not in current
+        ]
+
+        if previous_status == scan["status"] and not resources:
+            continue
+
+        drifts.append(
+            {
+                **scan,
+                "comment": f"Previously {previous_status}. {scan['comment']}".strip(),
+                "resources": resources,
+            }
+        )
+
+    return drifts
+
+
+def query(args):
+    """This function prints when the status of a check changed, from the results store
+
+    Args:
+            args (Namespace): Command line arguments (db, check, subscription, since)
+    """
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+    store = ResultStore(args.db, args.debug)
+    changes = store.history(args.check, args.subscription, since)
+    store.close()
+
+    if not changes:
+        warning(f"No results found for {args.check}")
+        return
+
+    # The same id can be used by multiple checks of the CSV, their rows are labeled with the CSV line
+    commands = {change["command"] for change in changes}
+    for change in changes:
+        date = datetime.fromtimestamp(change["started_at"]).isoformat(" ", "seconds")
+        comment = f" ({change['comment']})" if change["comment"] else ""
+        label = f"{args.check} (line {change['position'] + 2})" if len(commands) > 1 else args.check
+        print_audit_element(
+            label,
+            f"{date} - run {change['run_id']} - {change['subscription']}{comment}",
+            change["status"],
+        )
+
+
+def export(args):
+    """This function regenerates the XLSX file of a run from the results store
+
+    Args:
+            args (Namespace): Command line arguments (db, run, output)
+    """
+    store = ResultStore(args.db, args.debug)
+    run_id = args.run if args.run is not None else store.last_run()
+    results = store.run_results(run_id) if run_id is not None else []
+    resources = store.run_resources(run_id) if run_id is not None else {}
+    store.close()
+
+    if not results:
+        error(f"No results found for run {run_id}")
+        return -1
+
+    for result in results:
+        result["id"] = result["check_id"]
+        result["resources"] = resources.get(result["position"], [])
+    serialize(results, args.output, args.debug)
+    success(f"Run {run_id} written to {args.output}.")
+
+
+def merge(args):
+    """This function merges the partial results of every shard into the final XLSX/JSON file and/or the results store
+
+    Args:
+            args (Namespace): Command line arguments (partial, output, db)
+    """
+    partials = [PartialResult(path, args.debug).read() for path in args.partial]
+    try:
+        results = merge_partials(partials)
+    except AssertException as e:
+        error(e.message)
+        return -1
+
+    success(f"Merged {len(partials)} shards.")
+
+    if args.db:
+        subscription = partials[0]["subscription"]
+        store = ResultStore(args.db, args.debug)
+        run_id = store.start_run(partials[0].get("input"), subscription)
+        save_results(store, run_id, results, subscription)
+        store.finish_run(run_id)
+        store.close()
+        success(f"Run {run_id} saved to {args.db}.")
+
+    if args.output:
+        serialize(results, args.output, args.debug)
+        success(f"Results written to {args.output}.")
+
+
+def save_results(store, run_id, results, subscription):
+    for result in results:
+        store.add_check(
+            run_id,
+            result["position"],
+            result,
+            result["output_hash"],
+            result["duration"],
+            result["started_at"],
+            subscription,
+        )
+
+
+def serialize(results, output, debug):
+    cleaned_results = [
+        {key: result[key] for key in REPORT_KEYS} for result in results
+    ]
+
+    if output.endswith(".json"):
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(
+                [
+                    {
+                        **cleaned_result,
+                        "resources": [
+                            {"resource": resource["resource"], "status": resource["status"]}
+                            for resource in result.get("resources", [])
+                        ],
+                    }
+                    for cleaned_result, result in zip(cleaned_results, results)
+                ],
+                f,
+                indent=4,
+            )
+        return
+
+    resource_results = [
+        {
+            "id": result["id"],
+            "resource": resource["resource"],
+            "status": resource["status"],
+        }
+        for result in results
+        for resource in result.get("resources", [])
+    ]
+    ObjectSerializer(cleaned_results, output, debug, resource_results).serialize()
+
+
 async def main():
     args = parse_args()
     if args is None:
         return -1
 
+    match args.command:
+        case "query":
+            return query(args)
+        case "export":
+            return export(args)
+        case "merge":
+            return merge(args)
+
     info("Starting AzureKitty, connecting... This may take some time. Be patient.")
 
     if not platform.machine() in ("AMD64", "x86_64"):
@@ -99,6 +356,10 @@ async def main():
             "Some check may not work on this architecture. AzureAD module requires Amd64 architecture. The check will still be run, but they will likely say that the module is not found."
             )
 
+    for controller in CONTROLLERS.values():
+        controller.configure(debug=args.debug)
+    CONTROLLERS["az"].configure(max_concurrency=max(1, args.concurrency))
+
     assert_handler = AssertHandler()
     sess_ps = SessionPS(args.debug)
     sess_az = SessionAZ(args.debug)
@@ -140,10 +401,32 @@ async def main():
 
 
     objects = ObjectParser(args.input, args.debug).parse()
-    for obj in objects:
+    for position, obj in enumerate(objects):
         obj["comment"] = ""
+        obj["position"] = position
 
-    for scan in objects:
+    if args.shard:
+
+        def expand(scan):
+            batch = azaudit.batch_keywords(scan["command"]) if scan["type"] == "az" else None
+            return batch[0] if batch else None
+
+        objects, plan = shard_plan(objects, expand, *args.shard)
+        info(f"Running shard {args.shard[0]}/{args.shard[1]}: {len(objects)} scans.")
+
+    store = ResultStore(args.db, args.debug) if args.db else None
+    verdicts = {}
+    # A shard only reads the durations of the previous runs, its results are stored by merge
+    if store and not args.shard:
+        baseline = store.baseline_run(args.input, sess_az.subscription) if args.diff else None
+        if baseline is not None:
+            verdicts = store.verdicts(baseline)
+        run_id = store.start_run(args.input, sess_az.subscription)
+
+    def run(index):
+        scan = objects[index]
+        started_at = time.time()
+        start = time.perf_counter()
         try:
             output = scanner(scan, psaudit, mcaudit, azaudit)
         except Exception as e:
@@ -151,15 +434,51 @@ async def main():
                 error(e)
             scan["status"] = "Error"
             output = ""
-        scan = get_result(output, scan, None)
+        duration = time.perf_counter() - start
+        if not (args.diff and get_diff_result(output, scan, verdicts.get(verdict_key(scan)))):
+            get_result(output, scan, None)
+        scan["output_hash"] = fingerprint_scan(scan, output)
+        scan["duration"] = duration
+        scan["started_at"] = started_at
+
+    scheduler = Scheduler(store.durations() if store else {}, args.lanes, args.debug)
+    actual = scheduler.execute(scheduler.plan(objects), run)
 
     success(f"Fully scanned the Azure/Office365 configuration.")
+    scheduler.report(actual)
 
-    if args.output:
-        cleaned_result = {
-            key: result[key] for key in ["id", "name", "status", "comment"]
-        }
-        ObjectSerializer(cleaned_result, args.output, args.debug).serialize()
+    if args.shard:
+        for scan in objects:
+            indexes = scan.pop("shard_indexes", None) or range(len(scan.get("resources", [])))
+            scan.pop("shard_resources", None)
+            for resource, index in zip(scan.get("resources", []), indexes):
+                resource["index"] = index
+        PartialResult(args.partial[0], args.debug).write(
+            args.shard, plan, args.input, sess_az.subscription, objects
+        )
+        success(f"Partial results written to {args.partial[0]}.")
+        if store:
+            store.close()
+        return
+
+    if store:
+        save_results(store, run_id, objects, sess_az.subscription)
+        store.finish_run(run_id, scheduler.predicted)
+        store.close()
+        success(f"Run {run_id} saved to {args.db}.")
+
+    if args.diff:
+        objects = drift_report(objects, verdicts)
+        info(f"{len(objects)} checks changed since the previous run:")
+        for scan in objects:
+            print_audit_element(scan["id"], f"{scan['name']} ({scan['comment']})", scan["status"])
+            for resource in scan["resources"]:
+                print_audit_element(scan["id"], f"\t{resource['resource']}", resource["status"])
+
+    if args.output and not objects:
+        info(f"Nothing changed, {args.output} was not written.")
+    elif args.output:
+        serialize(objects, args.output, args.debug)
         success(f"Results written to {args.output}.")
 
 
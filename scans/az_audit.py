@@ -1,11 +1,28 @@
+import json
+import re
+import subprocess
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import timeout_decorator
-from azure.cli.core import get_default_cli
 from azure.identity import InteractiveBrowserCredential
 
 from .utils import *
 
+# Maximum duration of a single az call, retries excluded
+CMD_TIMEOUT = 30
+
+# Error codes printed by the AZ CLI, and the HTTP status they come from
+ARM_ERROR_CODES = {
+    "TooManyRequests": 429,
+    "ServiceUnavailable": 503,
+    "InternalServerError": 500,
+    "BadGateway": 502,
+    "GatewayTimeout": 504,
+}
+ARM_ERROR_PATTERN = re.compile(r"\(?(" + "|".join(ARM_ERROR_CODES) + r")\)?")
+
 
 class SessionAZ:
     def __init__(self, debug: bool) -> None:
@@ -13,6 +30,8 @@ class SessionAZ:
         self.assert_handler = AssertHandler()
         self.infos = {}
         self.debug = debug
+        self.subscription = None
+        self.throttle = get_controller("az")
 
     def __str__(self) -> None:
         print(f"Session Azure")
@@ -49,7 +68,7 @@ class SessionAZ:
         ):
             return False
 
-        code = self.run_cmd("login")
+        code = self.run_cmd("login", interactive=True)
         if not self.assert_handler.handle_assert(
             code is not False, "An error occurred while creating the session for Azure."
         ):
@@ -87,33 +106,75 @@ class SessionAZ:
         if self.debug:
             info(f"az account show: {code}")
 
+        if isinstance(code, dict):
+            self.subscription = code.get("id")
+
         return self.assert_handler.handle_assert(
             code is not False, "An error occurred while checking the session for Azure."
         )
 
-    def run_cmd(self, cmd: str) -> str:
+    def run_cmd(self, cmd: str, interactive: bool = False) -> str:
         """This function will run the command in the AZ CLI.
+        Every call runs in its own az process, the in-process CLI can't be used from multiple threads.
+        Throttled and transient failures are retried by the "az" ThrottleController.
 
         Args:
                 cmd (str): The command to run
+                interactive (bool): The command waits for the user (az login), its prompts are printed
+                        as they come (device code, URL to open...) and it never times out.
+                        Otherwise each attempt is stopped after CMD_TIMEOUT seconds.
 
         Returns:
                 str: the result of the command
         """
-        args = "-o none --only-show-errors"
-        cmds = cmd.split() + args.split()
-        cli = get_default_cli()
-
-        cli.invoke(cmds)
+        return self.throttle.run(self._invoke, cmd, interactive)
+
+    def _invoke(self, cmd: str, interactive: bool) -> str:
+        args = "-o json --only-show-errors"
+        cmds = [sys.executable, "-m", "azure.cli"] + cmd.split() + args.split()
+
+        try:
+            process = subprocess.run(
+                cmds,
+                stdout=subprocess.PIPE,
+                # stderr is left to the terminal for the prompts of an interactive command
+                stderr=None if interactive else subprocess.PIPE,
+                timeout=None if interactive else CMD_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            # subprocess.run() already killed the az process
+            raise timeout_decorator.TimeoutError("Timed Out")
 
         if self.debug:
-            info(f"run_cmd result: {cli.result.result}")
-
-        if cli.result.result:
-            return cli.result.result
+            info(f"run_cmd result: {process.stdout}")
+
+        if process.returncode != 0:
+            if process.stderr is None:
+                # Already printed by the interactive command
+                return None
+            error_message = process.stderr.decode(errors="replace").strip()
+            if self.debug:
+                error(f"run_cmd error: {error_message}")
+            self._raise_if_transient(error_message)
+            return None
+
+        if process.stdout.strip():
+            result = json.loads(process.stdout)
+            if result:
+                return result
 
         return None
 
+    @staticmethod
+    def _raise_if_transient(error_message: str):
+        """
+        This function raises a ThrottledError or a TransientError if the error printed by the AZ CLI
+        is worth retrying, otherwise it does nothing and the command is considered as failed.
+        """
+        match = ARM_ERROR_PATTERN.search(error_message)
+        if match is not None:
+            raise_for_status(ARM_ERROR_CODES[match.group(1)], None, f"ARM: {error_message}")
+
 
 class AZAudit:
     def __init__(self, session: SessionAZ, debug: bool) -> None:
@@ -121,7 +182,7 @@ class AZAudit:
         self.debug = debug
         self.session = session
 
-    def batch_run(self, args: str, keywords: list, substitutes: list) -> list:
+    def batch_run(self, args: str, keywords: list, substitutes: list) -> ResourceTable:
         """
         This function will take a command, and run it multiple times against a list of keywords to substitute with multiple names and resource groups that are present.
         Args:
@@ -129,40 +190,49 @@ class AZAudit:
                 keywords - the keywords that will be replaced
                 substitutes - the words that will replace the keywords
         Returns:
-                list - a list of all the command outputs.
+                ResourceTable - the output of the command for each resource
         """
-        results = []
-
         if substitutes is None:
             raise Exception(f"No {keywords[0][1:-1]} were found")
 
-        for name, resource_group in substitutes:
-            args = args.replace(keywords[0], name)
-            args = args.replace(keywords[1], resource_group)
+        cmds = [
+            args.replace(keywords[0], name).replace(keywords[1], resource_group)
+            for name, resource_group in substitutes
+        ]
+
+        # The pool is sized to the controller's ceiling, the controller decides how many calls really run
+        with ThreadPoolExecutor(max_workers=self.session.throttle.max_concurrency) as pool:
+            results = list(pool.map(self.run_resource, cmds))
 
-            result = self.session.run_cmd(args)
-            if isinstance(result, list):
-                results.extend(result)
-            else:
-                results.append(result)
+        return ResourceTable(
+            [f"{resource_group}/{name}" for name, resource_group in substitutes],
+            [output for output, _ in results],
+            [error for _, error in results],
+        )
 
-        return results
+    def run_resource(self, cmd: str) -> tuple:
+        """This function runs the command of one resource of a batch_run.
+        A failure (timeout, throttled after every retry...) only fails this resource, not the whole batch.
 
-    @timeout_decorator.timeout(30)
-    def az_run(self, args: str) -> list:
-        """This function launches an Azure command and returns the output.
-        It will also replace the arguments with the values from the session.
+        Returns:
+                tuple: (output, None), or (None, the error message) if the command failed
+        """
+        try:
+            return self.session.run_cmd(cmd), None
+        except Exception as e:
+            if self.debug:
+                error(f"{cmd}: {e}")
+            return None, str(e) or type(e).__name__
+
+    def batch_keywords(self, args: str) -> tuple:
+        """This function finds the resources a command has to be run against.
 
         Args:
                 args (str): The command to run
 
         Returns:
-                list: The result of the command
+                tuple: (substitutes, keywords) as expected by batch_run(), or None if it runs only once
         """
-        # Replace arguments with values from the session
-        for attr, value in self.session.infos.items():
-            args = args.replace(attr, value)
-
         replaceable_elems = [
             (
                 self.session.infos["<storage_accounts>"],
@@ -181,7 +251,32 @@ class AZAudit:
         for substitutes, keywords in replaceable_elems:
             for keyword in keywords:
                 if keyword in args:
-                    return self.batch_run(args, keywords, substitutes)
+                    return substitutes, keywords
+
+        return None
+
+    def az_run(self, args: str, resources: list = None) -> list:
+        """This function launches an Azure command and returns the output.
+        It will also replace the arguments with the values from the session.
+
+        Args:
+                args (str): The command to run
+                resources (list): Only run the command against these (name, resource group), used by --shard
+
+        Returns:
+                list: The result of the command, or a ResourceTable if it was run against multiple resources
+        """
+        # Replace arguments with values from the session, the resource lists are handled by batch_run()
+        for attr, value in self.session.infos.items():
+            if isinstance(value, str):
+                args = args.replace(attr, value)
+
+        batch = self.batch_keywords(args)
+        if batch is not None:
+            substitutes, keywords = batch
+            if resources is not None:
+                substitutes = resources
+            return self.batch_run(args, keywords, substitutes)
 
         if self.debug:
             info(f"Running command: {args}")
@@ -32,6 +32,18 @@ class MCAudit:
         self.debug = debug
         self.session = session
         self.secure_score = None
+        self.throttle = get_controller("mc")
 
     async def get_secure_score(self):
-        return await self.session.graph_client.security.secure_scores.get()
+        return await self.throttle.arun(self._get_secure_score)
+
+    async def _get_secure_score(self):
+        try:
+            return await self.session.graph_client.security.secure_scores.get()
+        except Exception as e:
+            raise_for_status(
+                getattr(e, "response_status_code", None),
+                getattr(e, "response_headers", None),
+                f"Graph: {e}",
+            )
+            raise
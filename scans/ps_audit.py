@@ -1,3 +1,4 @@
+import re
 import subprocess
 import time
 
@@ -5,6 +6,14 @@ import timeout_decorator
 
 from .utils import *
 
+# Messages written by Exchange Online / Teams cmdlets when the tenant is being throttled
+THROTTLING_PATTERN = re.compile(
+    rb"(ServerBusy|server is busy|TooManyRequests|\(429\)|been throttled|was throttled|MicroDelay)", re.IGNORECASE
+)
+RETRY_AFTER_PATTERN = re.compile(
+    rb"(?:retry[- ]after|try again (?:in|after))\D{0,5}(\d+)\s*(milliseconds|ms)?", re.IGNORECASE
+)
+
 
 class SessionPS:
     def __init__(self, debug) -> None:
@@ -13,6 +22,7 @@ class SessionPS:
         self.debug = debug
         # 
         self.infos = {}
+        self.throttle = get_controller("ps")
 
     def __str__(self) -> None:
         print(f"Session PowerShell")
@@ -96,9 +106,16 @@ class SessionPS:
         for ease of parsing.
         The return value is ONLY the result of the command
 
+        Throttled commands are retried by the "ps" ThrottleController.
+
         Return:
                 - bytes: result of the command(s)
         """
+        return self.throttle.run(self._invoke, cmd)
+
+    # The timeout applies to each attempt, the time spent waiting between retries isn't counted
+    @timeout_decorator.timeout(30)
+    def _invoke(self, cmd: str) -> bytes:
         start = "AZUREKITTY_START"
         end = "AZUREKITTY_END"
         command = f"echo {start}; {cmd}; echo {end}\n".encode("utf-8")
@@ -114,8 +131,25 @@ class SessionPS:
 
         parsed_result = result.split(start.encode(), 1)[-1].split(end.encode(), 1)[0][1:]
 
+        if THROTTLING_PATTERN.search(parsed_result):
+            raise ThrottledError(
+                f"Throttled by Exchange Online while running: {cmd}",
+                self._parse_retry_after(parsed_result),
+            )
+
         return parsed_result
 
+    @staticmethod
+    def _parse_retry_after(output: bytes) -> float:
+        match = RETRY_AFTER_PATTERN.search(output)
+        if match is None:
+            return None
+
+        delay = float(match.group(1))
+        if match.group(2):
+            delay /= 1000
+        return delay
+
     def ret_session(self) -> subprocess.Popen:
         return self.sess
 
@@ -129,7 +163,6 @@ class PSAudit:
     def ret_session(self) -> subprocess.Popen:
         return self.session.ret_session()
 
-    @timeout_decorator.timeout(30)
     def pwsh_run(self, cmd: str) -> bytes:
         """
         This function launches a PowerShell command and returns the output
@@ -1,2 +1,7 @@
 from .helper import *
-from .objects import *
\ No newline at end of file
+from .objects import *
+from .scheduler import *
+from .shard import *
+from .store import *
+from .table import *
+from .throttle import *
\ No newline at end of file
@@ -29,6 +29,24 @@ def read_until(subprocess_obj: subprocess.Popen, delimiter: str) -> bytes:
     return output
 
 
+def parse_shard(value: str) -> tuple:
+    """
+    This function parses a "K/N" shard argument, K going from 1 to N
+
+    Returns:
+            tuple: (K, N)
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}, expected K/N")
+
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}, K must be between 1 and N")
+
+    return index, count
+
+
 def parse_args():
     """
     This function lets us initialize command line arguments
@@ -39,13 +57,67 @@ def parse_args():
         epilog="Made by HKCM",
     )
 
+    ap.add_argument(
+        "command",
+        help="scan: audit the configuration (default), query: print the status changes of a check, export: regenerate the XLSX file of a stored run, merge: combine the partial results of every shard",
+        nargs="?",
+        default="scan",
+        choices=["scan", "query", "export", "merge"],
+    )
+
     ap.add_argument(
         "-i",
         "--input",
         help="Input a CSV file containing the audit config",
         default="audit_csv/ps.csv",
     )
-    ap.add_argument("-o", "--output", help="Output an XLSX file containing the results")
+    ap.add_argument(
+        "-o",
+        "--output",
+        help="Output an XLSX file containing the results (or a JSON file if it ends with .json)",
+    )
+    ap.add_argument(
+        "--db",
+        help="SQLite file where the results of every run are stored, required by query and export. With --shard, it is only read to estimate the duration of the checks",
+    )
+    ap.add_argument("--check", help="query: id of the check to look up (ex: A31)")
+    ap.add_argument("--subscription", help="query: only show the runs against this subscription")
+    ap.add_argument(
+        "--since", help="query: only show the runs started after this date (ex: 2026-01-31)"
+    )
+    ap.add_argument(
+        "--run", help="export: id of the run to export (default: latest run)", type=int
+    )
+    ap.add_argument(
+        "--diff",
+        help="Reuse the verdicts of the last stored run for the outputs that didn't change, -o then only contains the checks whose status changed",
+        default=False,
+        action="store_true",
+    )
+    ap.add_argument(
+        "--shard",
+        help="Only run the K-th of N shards of the check plan (ex: 2/4), the results are written with --partial",
+        type=parse_shard,
+    )
+    ap.add_argument(
+        "--partial",
+        help="scan: JSON file where the results of the shard are written, merge: partial result files of every shard",
+        nargs="+",
+    )
+    ap.add_argument(
+        "-c",
+        "--concurrency",
+        help="Maximum number of concurrent Azure calls, lowered automatically when throttled",
+        default=8,
+        type=int,
+    )
+    ap.add_argument(
+        "-l",
+        "--lanes",
+        help="Number of lanes the checks are spread across, the PowerShell checks always share the first one (default: 2)",
+        default=2,
+        type=int,
+    )
     ap.add_argument(
         "-d",
         "--debug",
@@ -56,6 +128,23 @@ def parse_args():
 
     args = ap.parse_args()
 
+    if args.command in ("query", "export") and args.db is None:
+        ap.error(f"{args.command} requires --db")
+    if args.command == "query" and args.check is None:
+        ap.error("query requires --check")
+    if args.command == "export" and args.output is None:
+        ap.error("export requires -o/--output")
+    if args.diff and args.db is None:
+        ap.error("--diff requires --db")
+    if args.shard and (args.partial is None or len(args.partial) != 1):
+        ap.error("--shard requires a single --partial file")
+    if args.shard and args.diff:
+        ap.error("--shard can't be used with --diff, the results are stored when merging them")
+    if args.command == "merge" and args.partial is None:
+        ap.error("merge requires --partial")
+    if args.command == "merge" and args.output is None and args.db is None:
+        ap.error("merge requires -o/--output or --db")
+
     return args
 
 
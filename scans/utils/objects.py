@@ -45,21 +45,26 @@ class ObjectParser():
 class ObjectSerializer:
     """
     This object does the exact opposite of ObjectParser, it turns a list of dicts into an XLSX file
+    The per-resource results, if any, are written in a second worksheet
     """
 
-    def __init__(self, objects: list[dict], output_file: str, debug: bool):
+    def __init__(
+        self,
+        objects: list[dict],
+        output_file: str,
+        debug: bool,
+        resources: list[dict] = None,
+    ):
         self.objects = objects
         self.output = output_file
         self.debug = debug
+        self.resources = resources or []
 
     def serialize(self):
         if self.debug:
             info(f"Writing to {self.output}")
 
         workbook = xw.Workbook(self.output)
-        worksheet = workbook.add_worksheet("Output")
-
-        header = list(self.objects[0].keys())
 
         bold_format = workbook.add_format({"bold": True})
         cell_formats = {
@@ -69,13 +74,21 @@ class ObjectSerializer:
             "NotApplicable": workbook.add_format({"bg_color": "#adadad"}),
         }
 
-        for column, value in enumerate(header):
-            worksheet.write(0, column, value, bold_format)
+        sheets = [("Output", self.objects)]
+        if self.resources:
+            sheets.append(("Resources", self.resources))
+
+        for name, objects in sheets:
+            worksheet = workbook.add_worksheet(name)
+            header = list(objects[0].keys())
+
+            for column, value in enumerate(header):
+                worksheet.write(0, column, value, bold_format)
 
-        for row, dic in enumerate(self.objects, start=1):
-            status = dic.get("status", "NotApplicable")
-            format_ = cell_formats.get(status, workbook.add_format())
-            for column, value in enumerate(dic.values()):
-                worksheet.write(row, column, value, format_)
+            for row, dic in enumerate(objects, start=1):
+                status = dic.get("status", "NotApplicable")
+                format_ = cell_formats.get(status, workbook.add_format())
+                for column, value in enumerate(dic.values()):
+                    worksheet.write(row, column, value, format_)
 
         workbook.close()
@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .helper import *
+
+# Estimated duration (in seconds) of a check that was never run before
+DEFAULT_ESTIMATE = 5.0
+
+
+class Scheduler:
+    """
+    This object spreads the scans across lanes, longest first (LPT), using the durations of the previous runs.
+        - lane 0 runs in the current thread, it is the only one allowed to run PowerShell scans since there is a single pwsh process
+        - the other lanes run in their own thread
+    """
+
+    def __init__(
+        self,
+        estimates: dict,
+        lanes: int,
+        debug: bool,
+        default_estimate: float = DEFAULT_ESTIMATE,
+    ):
+        self.estimates = estimates
+        self.lanes = max(1, lanes)
+        self.debug = debug
+        self.default_estimate = default_estimate
+        self.predicted = 0.0
+
+    def estimate(self, scan: dict) -> float:
+        """
+        Returns the expected duration of a scan, the estimates are keyed like ResultStore.durations()
+        """
+        return self.estimates.get(
+            (scan.get("id"), scan.get("command")), self.default_estimate
+        )
+
+    def plan(self, objects: list[dict]) -> list[list[int]]:
+        """
+        This function assigns every scan to a lane.
+        PowerShell scans are pinned to lane 0, then the other scans go, longest first, to the lane that
+        will be free the soonest.
+
+        Args:
+                objects (list[dict]): The scans, as parsed by ObjectParser
+
+        Returns:
+                list[list[int]]: The positions of the scans to run in each lane, longest first
+        """
+        loads = [0.0] * self.lanes
+        plan = [[] for _ in range(self.lanes)]
+
+        # Stable sort, the scans with the same estimate keep the CSV order
+        positions = sorted(
+            range(len(objects)), key=lambda position: -self.estimate(objects[position])
+        )
+        pinned = [p for p in positions if objects[p].get("type") == "ps"]
+        free = [p for p in positions if objects[p].get("type") != "ps"]
+
+        for position in pinned:
+            plan[0].append(position)
+            loads[0] += self.estimate(objects[position])
+
+        for position in free:
+            lane = loads.index(min(loads))
+            plan[lane].append(position)
+            loads[lane] += self.estimate(objects[position])
+
+        for lane in plan:
+            lane.sort(key=lambda position: -self.estimate(objects[position]))
+
+        self.predicted = max(loads)
+
+        if self.debug:
+            for index, load in enumerate(loads):
+                info(f"Lane {index}: {len(plan[index])} scans, {load:.1f}s estimated")
+
+        return plan
+
+    def execute(self, plan: list[list[int]], run) -> float:
+        """
+        This function runs every lane of the plan and waits for all of them.
+
+        Args:
+                plan (list[list[int]]): The plan returned by plan()
+                run (callable): Called with the position of each scan, it must not raise
+
+        Returns:
+                float: The actual runtime, in seconds
+        """
+        start = time.perf_counter()
+
+        def run_lane(lane):
+            for position in lane:
+                run(position)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(plan) - 1)) as pool:
+            futures = [pool.submit(run_lane, lane) for lane in plan[1:]]
+            run_lane(plan[0])
+            for future in futures:
+                future.result()
+
+        return time.perf_counter() - start
+
+    def report(self, actual: float):
+        """
+        Prints the predicted runtime against the actual one
+        """
+        if self.predicted:
+            drift = f" ({(actual - self.predicted) / self.predicted:+.0%})"
+        else:
+            drift = ""
+        info(
+            f"Predicted runtime: {self.predicted:.1f}s, actual runtime: {actual:.1f}s{drift}"
+        )
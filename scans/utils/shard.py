@@ -0,0 +1,184 @@
+import hashlib
+import json
+
+from .helper import *
+from .store import fingerprint_scan
+from .table import ResourceTable
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Returns the shard (from 1 to count) a plan unit belongs to, the same on every machine
+    """
+    return int(hashlib.sha1(key.encode()).hexdigest(), 16) % count + 1
+
+
+def shard_plan(objects: list[dict], expand, index: int, count: int) -> tuple:
+    """
+    This function splits the check plan into units and only keeps the units of one shard.
+    A unit is either a whole scan, or one resource of a scan that runs against multiple resources.
+
+    Args:
+            objects (list[dict]): The scans, as parsed by ObjectParser, with their "position"
+            expand (callable): Returns the (name, resource group) a command runs against, or None
+            index (int): The shard to keep (K)
+            count (int): The number of shards (N)
+
+    Returns:
+            tuple: The scans of the shard, and the fingerprint of the whole plan
+    """
+    shard = []
+    keys = []
+
+    for scan in objects:
+        key = f"{scan['position']}:{scan['id']}"
+        resources = expand(scan) or []
+
+        if not resources:
+            keys.append(key)
+            if shard_of(key, count) == index:
+                shard.append(scan)
+            continue
+
+        indexes = []
+        for resource_index, (name, resource_group) in enumerate(resources):
+            resource_key = f"{key}:{resource_group}/{name}"
+            keys.append(resource_key)
+            if shard_of(resource_key, count) == index:
+                indexes.append(resource_index)
+
+        if indexes:
+            shard.append(
+                {
+                    **scan,
+                    "shard_resources": [resources[i] for i in indexes],
+                    "shard_indexes": indexes,
+                }
+            )
+
+    plan = hashlib.sha256("\n".join(keys).encode()).hexdigest()
+    return shard, plan
+
+
+class PartialResult:
+    """
+    This object reads and writes the partial result file of a shard (JSON)
+        {
+            "shard": [K, N],
+            "plan": fingerprint of the whole plan, the same for every shard,
+            "input": the input CSV,
+            "subscription": ...,
+            "scans": [{"position", "id", "name", "status", "comment", "resources", ...}]
+        }
+    """
+
+    def __init__(self, path: str, debug: bool):
+        self.path = path
+        self.debug = debug
+
+    def write(
+        self, shard: tuple, plan: str, input_file: str, subscription: str, scans: list[dict]
+    ):
+        if self.debug:
+            info(f"Writing the partial results to {self.path}")
+
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "shard": list(shard),
+                    "plan": plan,
+                    "input": input_file,
+                    "subscription": subscription,
+                    "scans": scans,
+                },
+                f,
+            )
+
+    def read(self) -> dict:
+        if self.debug:
+            info(f"Reading the partial results from {self.path}")
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def merge_partials(partials: list[dict]) -> list[dict]:
+    """
+    This function merges the partial results of every shard back into the original plan order.
+    The resources of a scan split across shards are put back together and the scan is graded again from them,
+    unless one of its parts couldn't be graded, then the scan keeps the status of that part.
+
+    Args:
+            partials (list[dict]): The content of every partial result file
+
+    Returns:
+            list[dict]: The merged scans, in the same order as the input CSV
+    """
+    counts = {partial["shard"][1] for partial in partials}
+    if len(counts) != 1:
+        raise AssertException("The partial results don't have the same number of shards")
+
+    count = counts.pop()
+    found = sorted(partial["shard"][0] for partial in partials)
+    if found != list(range(1, count + 1)):
+        raise AssertException(
+            f"Expected the partial results of shards 1 to {count}, found {found}"
+        )
+
+    for key in ("input", "subscription"):
+        values = {partial.get(key) for partial in partials}
+        if len(values) != 1:
+            raise AssertException(
+                f"The shards didn't run with the same {key}, found {sorted(map(str, values))}"
+            )
+
+    if len({partial["plan"] for partial in partials}) != 1:
+        warning(
+            "The shards didn't run the same plan (resources changed between them?), the merged results may be incomplete."
+        )
+
+    parts = {}
+    for partial in partials:
+        for scan in partial["scans"]:
+            parts.setdefault(scan["position"], []).append(scan)
+
+    merged = []
+    for position in sorted(parts):
+        scans = parts[position]
+        scan = dict(scans[0])
+
+        if len(scans) > 1:
+            resources = sorted(
+                (resource for part in scans for resource in part.get("resources", [])),
+                key=lambda resource: resource["index"],
+            )
+            # A part that failed before being graded (timeout, error...) has no resources to merge,
+            # the check is then as incomplete as it would be in a single run
+            incomplete = [
+                part["status"]
+                for part in scans
+                if not part.get("resources")
+                or part["status"]
+                != ResourceTable.aggregate(
+                    [resource["status"] for resource in part["resources"]],
+                    part.get("applies_if_empty"),
+                )
+            ]
+            comments = [part["comment"] for part in scans if part["comment"]]
+
+            scan["resources"] = resources
+            scan["comment"] = " | ".join(dict.fromkeys(comments))
+            scan["duration"] = sum(part["duration"] for part in scans)
+            scan["started_at"] = min(part["started_at"] for part in scans)
+            scan["output_hash"] = fingerprint_scan(scan, None)
+            if incomplete:
+                scan["status"] = "Error" if "Error" in incomplete else incomplete[0]
+            else:
+                scan["status"] = ResourceTable.aggregate(
+                    [resource["status"] for resource in resources],
+                    scan.get("applies_if_empty"),
+                )
+
+        merged.append(scan)
+
+    return merged
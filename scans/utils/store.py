@@ -0,0 +1,374 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+from .helper import *
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    input TEXT,
+    subscription TEXT,
+    predicted_runtime REAL
+);
+
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    check_id TEXT NOT NULL,
+    name TEXT,
+    type TEXT,
+    command TEXT,
+    check_value TEXT,
+    applies_if_empty TEXT,
+    status TEXT,
+    comment TEXT,
+    output_hash TEXT,
+    duration REAL,
+    started_at REAL NOT NULL,
+    subscription TEXT
+);
+
+CREATE TABLE IF NOT EXISTS resources (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    check_row INTEGER NOT NULL REFERENCES checks(id),
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    check_id TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    status TEXT,
+    output_hash TEXT,
+    started_at REAL NOT NULL,
+    subscription TEXT
+);
+
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs(started_at);
+CREATE INDEX IF NOT EXISTS checks_by_run ON checks(run_id, position);
+-- Covers history(), so the trend queries never have to read the checks table itself
+DROP INDEX IF EXISTS checks_by_check;
+CREATE INDEX IF NOT EXISTS checks_by_command ON checks(
+    check_id, subscription, command, started_at, status, run_id, comment, position
+);
+CREATE INDEX IF NOT EXISTS checks_by_subscription ON checks(subscription, check_id, started_at);
+CREATE INDEX IF NOT EXISTS resources_by_check_row ON resources(check_row);
+CREATE INDEX IF NOT EXISTS resources_by_check ON resources(check_id, resource, started_at);
+CREATE INDEX IF NOT EXISTS resources_by_subscription ON resources(subscription, check_id, started_at);
+"""
+
+# Columns added after the first version of the schema, they are created on the fly in older stores
+ADDED_COLUMNS = [
+    ("runs", "predicted_runtime", "REAL"),
+]
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+
+def normalize_output(output) -> str:
+    """
+    This function turns the output of a command into a stable string, so that two identical
+    configurations always give the same fingerprint.
+        - PowerShell (bytes): colors and trailing whitespaces are removed
+        - Azure (json-like): keys are sorted
+    """
+    if isinstance(output, (bytes, bytearray)):
+        text = ANSI_ESCAPE.sub("", output.decode(errors="replace"))
+        return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+    return json.dumps(output, sort_keys=True, default=str)
+
+
+def fingerprint(output) -> str:
+    """
+    Returns the sha256 of the normalized output, or None if there is no output
+    """
+    if output is None:
+        return None
+
+    return hashlib.sha256(normalize_output(output).encode()).hexdigest()
+
+
+def fingerprint_scan(scan: dict, output) -> str:
+    """
+    Returns the fingerprint of the output of a graded scan. When the scan ran against multiple resources,
+    it is built from the fingerprint of each resource, so it can be compared resource by resource.
+    """
+    if "resources" in scan:
+        return fingerprint(
+            {resource["resource"]: resource["output_hash"] for resource in scan["resources"]}
+        )
+
+    return fingerprint(output)
+
+
+def verdict_key(scan: dict) -> tuple:
+    """
+    Returns what identifies the verdict of a scan across runs: the same command graded the same way
+    """
+    return (
+        scan.get("id"),
+        scan.get("type"),
+        scan.get("command"),
+        scan.get("check"),
+        scan.get("applies_if_empty"),
+    )
+
+
+class ResultStore:
+    """
+    This object keeps the history of every run in a local SQLite database
+        runs      -> one row per AzureKitty run
+        checks    -> one row per check and per run (status, comment, output hash, duration)
+        resources -> one row per resource for the checks that run against multiple resources
+    """
+
+    def __init__(self, path: str, debug: bool):
+        self.path = path
+        self.debug = debug
+
+        if self.debug:
+            info(f"Opening the results store {self.path}")
+
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+        for table, column, type_ in ADDED_COLUMNS:
+            columns = [row["name"] for row in self.db.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type_}")
+
+    def close(self):
+        self.db.close()
+
+    def start_run(self, input_file: str, subscription: str = None) -> int:
+        """
+        Creates a new run and returns its id
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (started_at, input, subscription) VALUES (?, ?, ?)",
+                (time.time(), input_file, subscription),
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id: int, predicted_runtime: float = None):
+        with self.db:
+            self.db.execute(
+                "UPDATE runs SET finished_at = ?, predicted_runtime = ? WHERE id = ?",
+                (time.time(), predicted_runtime, run_id),
+            )
+
+    def add_check(
+        self,
+        run_id: int,
+        position: int,
+        scan: dict,
+        output_hash: str,
+        duration: float,
+        started_at: float,
+        subscription: str = None,
+    ) -> int:
+        """
+        This function saves the result of a scan, and the result of each of its resources if it has any.
+
+        Args:
+                run_id (int): The run the scan belongs to
+                position (int): The position of the scan in the input CSV
+                scan (dict): The scan, once graded by get_result()
+                output_hash (str): The fingerprint of the raw output of the command
+                duration (float): How long the command took, in seconds
+                started_at (float): When the command was started (epoch)
+                subscription (str): The Azure subscription the scan was run against
+
+        Returns:
+                int: The id of the check row
+        """
+        with self.db:
+            cursor = self.db.execute(
+                """
+                INSERT INTO checks (
+                    run_id, position, check_id, name, type, command, check_value, applies_if_empty,
+                    status, comment, output_hash, duration, started_at, subscription
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    run_id,
+                    position,
+                    scan.get("id"),
+                    scan.get("name"),
+                    scan.get("type"),
+                    scan.get("command"),
+                    scan.get("check"),
+                    scan.get("applies_if_empty"),
+                    scan.get("status"),
+                    scan.get("comment"),
+                    output_hash,
+                    duration,
+                    started_at,
+                    subscription,
+                ),
+            )
+            self.db.executemany(
+                """
+                INSERT INTO resources (
+                    check_row, run_id, check_id, resource, status, output_hash, started_at, subscription
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        cursor.lastrowid,
+                        run_id,
+                        scan.get("id"),
+                        resource["resource"],
+                        resource["status"],
+                        resource.get("output_hash"),
+                        started_at,
+                        subscription,
+                    )
+                    for resource in scan.get("resources", [])
+                ],
+            )
+        return cursor.lastrowid
+
+    def last_run(self) -> int:
+        """
+        Returns the id of the latest finished run, or None if the store is empty
+        """
+        row = self.db.execute(
+            "SELECT id FROM runs WHERE finished_at IS NOT NULL ORDER BY started_at DESC LIMIT 1"
+        ).fetchone()
+        return row["id"] if row else None
+
+    def baseline_run(self, input_file: str, subscription: str) -> int:
+        """
+        Returns the id of the latest finished run of the same input file against the same subscription,
+        or None if there is none
+        """
+        row = self.db.execute(
+            """
+            SELECT id FROM runs
+            WHERE finished_at IS NOT NULL AND input IS ? AND subscription IS ?
+            ORDER BY started_at DESC LIMIT 1
+            """,
+            (input_file, subscription),
+        ).fetchone()
+        return row["id"] if row else None
+
+    def durations(self, last_runs: int = 10) -> dict:
+        """
+        Returns the average duration of each check over the last finished runs, by (check id, command).
+        The command is part of the key since the same id can be used by multiple checks of the CSV.
+        """
+        rows = self.db.execute(
+            """
+            SELECT check_id, command, AVG(duration) AS duration FROM checks
+            WHERE duration IS NOT NULL AND run_id IN (
+                SELECT id FROM runs WHERE finished_at IS NOT NULL ORDER BY started_at DESC LIMIT ?
+            )
+            GROUP BY check_id, command
+            """,
+            (last_runs,),
+        ).fetchall()
+        return {(row["check_id"], row["command"]): row["duration"] for row in rows}
+
+    def run_results(self, run_id: int) -> list[dict]:
+        """
+        Returns the checks of a run, in the same order as the input CSV
+        """
+        rows = self.db.execute(
+            "SELECT * FROM checks WHERE run_id = ? ORDER BY position", (run_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def run_resources(self, run_id: int) -> dict:
+        """
+        Returns the per-resource results of a run, grouped by the position of their check
+        """
+        rows = self.db.execute(
+            """
+            SELECT checks.position, resource, resources.status, resources.output_hash
+            FROM checks JOIN resources ON resources.check_row = checks.id
+            WHERE checks.run_id = ?
+            ORDER BY checks.position, resources.id
+            """,
+            (run_id,),
+        ).fetchall()
+
+        resources = {}
+        for row in rows:
+            resources.setdefault(row["position"], []).append(
+                {
+                    "resource": row["resource"],
+                    "status": row["status"],
+                    "output_hash": row["output_hash"],
+                }
+            )
+        return resources
+
+    def verdicts(self, run_id: int) -> dict:
+        """
+        This function returns the verdicts of a run, to be reused by the next one (--diff)
+
+        Returns:
+                dict: status, output_hash and resources of each scan, by verdict_key()
+        """
+        resources = self.run_resources(run_id)
+        verdicts = {}
+
+        for row in self.run_results(run_id):
+            scan = {
+                "id": row["check_id"],
+                "type": row["type"],
+                "command": row["command"],
+                "check": row["check_value"],
+                "applies_if_empty": row["applies_if_empty"],
+            }
+            verdicts[verdict_key(scan)] = {
+                "status": row["status"],
+                "output_hash": row["output_hash"],
+                "resources": resources.get(row["position"], []),
+            }
+
+        return verdicts
+
+    def history(
+        self, check_id: str, subscription: str = None, since: float = None
+    ) -> list[dict]:
+        """
+        This function returns the status changes of a check over time.
+        Only the runs where the status differs from the previous run are returned, so the first
+        row with a "False" status is when the check started failing.
+        The same id can be used by multiple checks of the CSV (ex: O12), each command has its own timeline.
+
+        Args:
+                check_id (str): The id of the check (ex: A31)
+                subscription (str): Only keep the runs against this subscription
+                since (float): Only keep the runs started after this date (epoch)
+
+        Returns:
+                list[dict]: started_at, run_id, subscription, position, command, status, comment of each change
+        """
+        rows = self.db.execute(
+            """
+            SELECT started_at, run_id, subscription, position, command, status, comment FROM (
+                SELECT
+                    started_at, run_id, subscription, position, command, status, comment,
+                    LAG(status) OVER (
+                        PARTITION BY subscription, command ORDER BY started_at
+                    ) AS previous
+                FROM checks
+                WHERE check_id = :check_id
+                  AND (:subscription IS NULL OR subscription = :subscription)
+                  AND (:since IS NULL OR started_at >= :since)
+            )
+            WHERE previous IS NULL OR previous != status
+            ORDER BY started_at, position
+            """,
+            {"check_id": check_id, "subscription": subscription, "since": since},
+        ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,112 @@
+import re
+
+from .store import fingerprint
+
+
+class ResourceTable:
+    """
+    This object keeps the outputs of a batch_run as columns, one row per resource
+        resources -> "<resource_group>/<name>" of each resource
+        outputs   -> the raw output of the command for each resource
+        errors    -> why the command failed for each resource (timeout, throttled...), None if it didn't
+    The whole column is graded at once by grade(), so each resource gets its own status.
+    """
+
+    def __init__(self, resources: list = None, outputs: list = None, errors: list = None):
+        self.resources = list(resources or [])
+        self.outputs = list(outputs or [])
+        self.errors = list(errors or [None] * len(self.resources))
+
+    def __len__(self) -> int:
+        return len(self.resources)
+
+    def __bool__(self) -> bool:
+        return len(self) != 0
+
+    def select(self, indexes: list):
+        """
+        Returns a new table with only the given rows
+        """
+        return ResourceTable(
+            [self.resources[i] for i in indexes],
+            [self.outputs[i] for i in indexes],
+            [self.errors[i] for i in indexes],
+        )
+
+    def fingerprints(self) -> list:
+        return [fingerprint(output) for output in self.outputs]
+
+    @staticmethod
+    def predicate(check: str):
+        """
+        Compiles the check once into a function that takes the str() of an entry
+        """
+        if check.startswith("regex"):
+            return re.compile(" ".join(check.split()[1:])).search
+        return lambda entry: check in entry
+
+    def grade(self, check: str, applies_if_empty: str) -> list:
+        """
+        This function grades every resource of the table against the same check.
+            - a resource whose command failed (see errors) is an Error
+            - a resource with no output (None) fails, the command didn't work for it
+            - a resource with an empty output is NotApplicable if applies_if_empty is "False"
+            - otherwise every entry of the resource output has to match the check
+
+        Args:
+                check (str): The check of the scan
+                applies_if_empty (str): "True" or "False"
+
+        Returns:
+                list: The status of each resource, in the same order as the table
+        """
+        if check == "None":
+            statuses = ["True"] * len(self)
+        elif check == "":
+            statuses = ["False"] * len(self)
+        else:
+            statuses = self._match(check, applies_if_empty)
+
+        return [
+            "Error" if error is not None else status
+            for status, error in zip(statuses, self.errors)
+        ]
+
+    def _match(self, check: str, applies_if_empty: str) -> list:
+        matches = self.predicate(check)
+
+        # Column of entries, the None entries can never match
+        entries = [
+            output if isinstance(output, list) else [output] for output in self.outputs
+        ]
+        valid = [
+            all(entry is not None and matches(str(entry)) for entry in resource_entries)
+            for resource_entries in entries
+        ]
+
+        statuses = [str(is_valid) for is_valid in valid]
+
+        if applies_if_empty == "False":
+            statuses = [
+                "NotApplicable" if output is not None and not output else status
+                for output, status in zip(self.outputs, statuses)
+            ]
+
+        return statuses
+
+    @staticmethod
+    def aggregate(statuses: list, applies_if_empty: str) -> str:
+        """
+        Derives the status of the whole check from the status of its resources.
+        One failing resource fails the check, NotApplicable resources are ignored.
+        When no resource fails but some of them couldn't be checked, the check is an Error.
+        """
+        if not statuses:
+            return "NotApplicable" if applies_if_empty == "False" else "True"
+        if "False" in statuses:
+            return "False"
+        if "Error" in statuses:
+            return "Error"
+        if "True" in statuses:
+            return "True"
+        return "NotApplicable"
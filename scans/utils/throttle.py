@@ -0,0 +1,281 @@
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+
+from .helper import *
+
+
+# HTTP status codes that are worth retrying, the first ones mean we are being throttled
+THROTTLED_STATUS_CODES = (429, 503)
+TRANSIENT_STATUS_CODES = (500, 502, 504)
+
+
+class TransientError(Exception):
+    """
+    Raised by a backend call when the failure is worth retrying (5xx, dropped connection...)
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class ThrottledError(TransientError):
+    """
+    Raised by a backend call when the service explicitly throttled us (429, 503, Server Busy...)
+    """
+
+
+def parse_retry_after(value) -> float:
+    """
+    This function turns a Retry-After value into a number of seconds.
+    The value can either be a delay in seconds or an HTTP date.
+
+    Args:
+            value (str|int|float): The Retry-After header value
+
+    Returns:
+            float: The number of seconds to wait, or None if it couldn't be parsed
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, (int, float)):
+        return max(0.0, float(value))
+
+    value = str(value).strip()
+    if re.fullmatch(r"\d+(\.\d+)?", value):
+        return float(value)
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, date.timestamp() - time.time())
+
+
+def get_header(headers, name: str):
+    """
+    Case insensitive lookup in a headers mapping, returns None if it's not there
+    """
+    if not headers:
+        return None
+
+    for key, value in dict(headers).items():
+        if str(key).lower() == name.lower():
+            return value
+
+    return None
+
+
+def raise_for_status(status_code: int, headers, message: str):
+    """
+    This function raises a ThrottledError or a TransientError if a call that failed with this HTTP status
+    is worth retrying, otherwise it does nothing and the caller handles the failure.
+
+    Args:
+            status_code (int): The HTTP status of the failed call, if known
+            headers (dict): The headers of the response, used for Retry-After
+            message (str): Description of the failure
+    """
+    retry_after = parse_retry_after(get_header(headers, "Retry-After"))
+
+    if status_code in THROTTLED_STATUS_CODES:
+        raise ThrottledError(f"Throttled ({status_code}): {message}", retry_after)
+
+    if status_code in TRANSIENT_STATUS_CODES:
+        raise TransientError(f"Transient failure ({status_code}): {message}", retry_after)
+
+
+class ThrottleController:
+    """
+    This object limits and adapts the number of concurrent calls made against one backend.
+
+    It follows an AIMD scheme:
+        - every successful call increases the concurrency limit by 1/limit (about +1 per full window)
+        - a throttled call halves the concurrency limit, once per window: the calls that were already
+          in flight when the limit was lowered are throttled by the same event and don't lower it again
+    Throttled and transient calls are retried with a jittered exponential backoff, or after the
+    delay asked by the service (Retry-After) when there is one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+        debug: bool = False,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.debug = debug
+
+        self._limit = float(min(max_concurrency, max(min_concurrency, 2)))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        # Incremented every time the limit is lowered, a call only lowers it if it started after that
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """The number of calls currently allowed to run at the same time"""
+        return int(self._limit)
+
+    def configure(self, **kwargs):
+        """
+        This function updates the settings of the controller (max_concurrency, max_retries...)
+        """
+        with self._condition:
+            for key, value in kwargs.items():
+                if value is not None:
+                    setattr(self, key, value)
+            self._limit = min(
+                float(self.max_concurrency), max(float(self.min_concurrency), self._limit)
+            )
+            self._condition.notify_all()
+
+    def acquire(self) -> int:
+        """
+        Blocks until a slot is available and the backend isn't paused by a Retry-After.
+        Returns the generation of the limit the call runs under, to be given to on_throttle()
+        """
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return self._generation
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            previous = self.limit
+            self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+            if self.limit != previous:
+                if self.debug:
+                    info(f"[{self.name}] Concurrency raised to {self.limit}")
+                self._condition.notify_all()
+
+    def on_throttle(self, retry_after=None, generation: int = None):
+        """
+        Lowers the limit, unless the call (started under generation) was already in flight the last time
+        it was lowered. The Retry-After pause is always honoured.
+        """
+        with self._condition:
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+            if generation is not None and generation != self._generation:
+                return
+            self._limit = max(float(self.min_concurrency), self._limit / 2)
+            self._generation += 1
+            if self.debug:
+                warning(f"[{self.name}] Throttled, concurrency lowered to {self.limit}")
+
+    def backoff(self, attempt: int, retry_after=None) -> float:
+        """
+        This function returns how long to wait before the next attempt.
+
+        Args:
+                attempt (int): The number of the attempt that just failed, starting at 0
+                retry_after (float): The delay asked by the service, if any
+
+        Returns:
+                float: The delay in seconds
+        """
+        if retry_after is not None:
+            # Small jitter so that all the waiting workers don't come back at the same time
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _handle_failure(self, e: TransientError, attempt: int, generation: int) -> float:
+        if isinstance(e, ThrottledError):
+            self.on_throttle(e.retry_after, generation)
+
+        if attempt >= self.max_retries:
+            raise e
+
+        delay = self.backoff(attempt, e.retry_after)
+        if self.debug:
+            warning(
+                f"[{self.name}] {e.message} - retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})"
+            )
+        return delay
+
+    def run(self, func, *args, **kwargs):
+        """
+        This function runs func inside a concurrency slot, and retries it while it raises a TransientError.
+        Any other exception is passed through untouched.
+        """
+        attempt = 0
+        while True:
+            generation = self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except TransientError as e:
+                delay = self._handle_failure(e, attempt, generation)
+            else:
+                self.on_success()
+                return result
+            finally:
+                self.release()
+
+            time.sleep(delay)
+            attempt += 1
+
+    async def arun(self, func, *args, **kwargs):
+        """
+        Same as run() for coroutine functions
+        """
+        attempt = 0
+        while True:
+            generation = await asyncio.to_thread(self.acquire)
+            try:
+                result = await func(*args, **kwargs)
+            except TransientError as e:
+                delay = self._handle_failure(e, attempt, generation)
+            else:
+                self.on_success()
+                return result
+            finally:
+                self.release()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+"""
+One controller per backend, shared by every session and audit object of the process
+    az -> Azure Resource Manager (az cli)
+    ps -> Exchange Online / Teams (PowerShell), there is only one pwsh process so it never goes above 1
+    mc -> Microsoft Graph
+"""
+CONTROLLERS = {
+    "az": ThrottleController("az", max_concurrency=8),
+    "ps": ThrottleController("ps", max_concurrency=1),
+    "mc": ThrottleController("mc", max_concurrency=4),
+}
+
+
+def get_controller(backend: str) -> ThrottleController:
+    return CONTROLLERS[backend]
@@ -0,0 +1,78 @@
+import main
+from scans import AZAudit, ResourceTable
+from scans.utils.throttle import ThrottleController
+
+
+class StubSession:
+    """Stands in for SessionAZ, answers every command with its own text"""
+
+    def __init__(self):
+        self.throttle = ThrottleController("test", max_concurrency=4)
+        self.infos = {
+            "<subscriptionid>": {"accessToken": "...", "subscription": "sub"},
+            "<storage_accounts>": [["sa1", "rg1"], ["sa2", "rg2"]],
+            "<postgres_servers>": None,
+            "<azure_sql_servers>": [],
+        }
+        self.commands = []
+
+    def run_cmd(self, cmd):
+        self.commands.append(cmd)
+        return [cmd]
+
+
+def test_az_run_reaches_batch_run():
+    session = StubSession()
+    output = AZAudit(session, False).az_run(
+        "storage account show --name <storage_account_name> -g <storage_resource_group>"
+    )
+
+    assert isinstance(output, ResourceTable)
+    assert output.resources == ["rg1/sa1", "rg2/sa2"]
+    assert sorted(session.commands) == [
+        "storage account show --name sa1 -g rg1",
+        "storage account show --name sa2 -g rg2",
+    ]
+
+
+def test_az_run_only_runs_the_given_resources():
+    session = StubSession()
+    output = AZAudit(session, False).az_run(
+        "storage account show --name <storage_account_name>", [["sa2", "rg2"]]
+    )
+    assert output.resources == ["rg2/sa2"]
+
+
+def test_az_run_single_command():
+    session = StubSession()
+    assert AZAudit(session, False).az_run("network nsg list") == ["network nsg list"]
+
+
+def test_get_result_grades_each_resource():
+    scan = {"type": "az", "id": "A1", "name": "n", "check": "sa1", "applies_if_empty": "False"}
+    table = ResourceTable(["rg1/sa1", "rg2/sa2"], [["sa1"], ["sa2"]])
+
+    main.get_result(table, scan, None)
+
+    assert [resource["status"] for resource in scan["resources"]] == ["True", "False"]
+    assert scan["status"] == "False"
+
+
+def test_one_failing_resource_does_not_fail_the_batch():
+    session = StubSession()
+    session.infos["<storage_accounts>"] = [["sa1", "rg1"], ["sa2", "rg2"], ["sa3", "rg3"]]
+
+    def run_cmd(cmd):
+        if "sa2" in cmd:
+            raise Exception("Timed Out")
+        return [cmd]
+
+    session.run_cmd = run_cmd
+    output = AZAudit(session, False).az_run("storage account show --name <storage_account_name>")
+    scan = {"type": "az", "id": "A1", "name": "n", "check": "sa", "applies_if_empty": "False", "comment": ""}
+
+    main.get_result(output, scan, None)
+
+    assert [resource["status"] for resource in scan["resources"]] == ["True", "Error", "True"]
+    assert scan["status"] == "Error"
+    assert scan["comment"] == "rg2/sa2: Timed Out"
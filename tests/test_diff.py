@@ -0,0 +1,105 @@
+import main
+from scans import ResourceTable
+from scans.utils.store import *
+
+
+def resource_scan(**kwargs):
+    return {
+        "id": "A1",
+        "name": "n",
+        "type": "az",
+        "command": "storage account show --name <storage_account_name>",
+        "check": "True",
+        "applies_if_empty": "False",
+        "comment": "",
+        **kwargs,
+    }
+
+
+def graded(table):
+    scan = resource_scan()
+    main.get_result(table, scan, None)
+    return scan
+
+
+def previous_verdict(scan, table):
+    return {
+        "status": scan["status"],
+        "output_hash": fingerprint_scan(scan, table),
+        "resources": scan["resources"],
+    }
+
+
+def test_unchanged_output_reuses_the_verdict(monkeypatch):
+    scan = {"id": "O1", "name": "n", "type": "ps", "comment": ""}
+    previous = {"status": "True", "output_hash": fingerprint(b"abc"), "resources": []}
+    monkeypatch.setattr(main, "get_result", None)
+
+    assert main.get_diff_result(b"\x1b[0mabc\n", scan, previous)
+    assert scan["status"] == "True"
+
+
+def test_changed_output_is_graded_again():
+    scan = {"id": "O1", "name": "n", "type": "ps", "comment": ""}
+    previous = {"status": "True", "output_hash": fingerprint(b"abc"), "resources": []}
+
+    assert not main.get_diff_result(b"abd", scan, previous)
+    assert "status" not in scan
+
+
+def test_only_changed_resources_are_graded_again():
+    before = ResourceTable(["rg/a", "rg/b"], [[True], [True]])
+    previous = previous_verdict(graded(before), before)
+    # rg/a is unchanged, its stale verdict must be kept as is
+    previous["resources"][0]["status"] = "False"
+
+    scan = resource_scan()
+    after = ResourceTable(["rg/a", "rg/b"], [[True], [False]])
+
+    assert main.get_diff_result(after, scan, previous)
+    assert [r["status"] for r in scan["resources"]] == ["False", "False"]
+
+
+def test_drift_report_lists_changed_and_removed_resources():
+    before = ResourceTable(["rg/a", "rg/b", "rg/c"], [[True], [True], [True]])
+    previous = graded(before)
+    verdicts = {verdict_key(previous): previous_verdict(previous, before)}
+
+    current = graded(ResourceTable(["rg/a", "rg/b"], [[True], [False]]))
+    drifts = main.drift_report([current], verdicts)
+
+    assert [(r["resource"], r["status"]) for r in drifts[0]["resources"]] == [
+        ("rg/b", "False"),
+        ("rg/c", "Removed"),
+    ]
+    assert drifts[0]["comment"] == "Previously True."
+    assert main.drift_report([previous], verdicts) == []
+
+
+def test_baseline_is_scoped_by_input_and_subscription(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    runs = {}
+    for input_file, subscription in [("a.csv", "A"), ("a.csv", "B"), ("b.csv", "A")]:
+        runs[input_file, subscription] = store.start_run(input_file, subscription)
+        store.finish_run(runs[input_file, subscription])
+
+    assert store.baseline_run("a.csv", "A") == runs["a.csv", "A"]
+    assert store.baseline_run("a.csv", "B") == runs["a.csv", "B"]
+    assert store.baseline_run("c.csv", "A") is None
+    store.close()
+
+
+def test_verdicts_come_back_from_the_store(tmp_path):
+    table = ResourceTable(["rg/a", "rg/b"], [[True], [False]])
+    scan = graded(table)
+
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    run_id = store.start_run("a.csv", "A")
+    store.add_check(run_id, 0, scan, fingerprint_scan(scan, table), 1.0, 0.0, "A")
+    store.finish_run(run_id)
+
+    verdict = store.verdicts(run_id)[verdict_key(scan)]
+    assert verdict["status"] == "False"
+    assert verdict["output_hash"] == fingerprint_scan(scan, table)
+    assert [r["resource"] for r in verdict["resources"]] == ["rg/a", "rg/b"]
+    store.close()
@@ -0,0 +1,63 @@
+import threading
+
+from scans.utils.scheduler import Scheduler
+
+
+def scans(*types):
+    return [
+        {"id": f"C{position}", "command": "cmd", "type": type_}
+        for position, type_ in enumerate(types)
+    ]
+
+
+def test_powershell_scans_are_pinned_to_the_first_lane():
+    objects = scans("ps", "az", "ps", "az")
+    plan = Scheduler({("C1", "cmd"): 100}, 3, False).plan(objects)
+
+    assert sorted(plan[0]) == [0, 2]
+    assert plan[1] == [1]
+
+
+def test_longest_first_across_lanes():
+    objects = scans("az", "az", "az", "az", "az")
+    estimates = {
+        (f"C{position}", "cmd"): duration for position, duration in enumerate([1, 8, 3, 4, 4])
+    }
+    scheduler = Scheduler(estimates, 2, False)
+
+    plan = scheduler.plan(objects)
+
+    assert plan == [[1, 2], [3, 4, 0]]
+    assert scheduler.predicted == 11
+
+
+def test_default_estimate_keeps_the_csv_order():
+    objects = scans("az", "az", "az")
+    plan = Scheduler({}, 1, False, default_estimate=2).plan(objects)
+
+    assert plan == [[0, 1, 2]]
+
+
+def test_execute_runs_every_scan_and_the_first_lane_in_the_main_thread():
+    objects = scans("ps", "az", "az", "ps")
+    scheduler = Scheduler({}, 3, False)
+    threads = {}
+
+    def run(position):
+        threads[position] = threading.current_thread() is threading.main_thread()
+
+    scheduler.execute(scheduler.plan(objects), run)
+
+    assert sorted(threads) == [0, 1, 2, 3]
+    assert threads[0] and threads[3]
+
+
+def test_checks_sharing_an_id_have_their_own_estimate():
+    objects = [
+        {"id": "O12", "command": "Get", "type": "az"},
+        {"id": "O12", "command": "Set", "type": "az"},
+    ]
+    scheduler = Scheduler({("O12", "Get"): 1, ("O12", "Set"): 9}, 1, False)
+
+    assert scheduler.plan(objects) == [[1, 0]]
+    assert scheduler.predicted == 10
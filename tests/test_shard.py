@@ -0,0 +1,121 @@
+from argparse import Namespace
+
+import pytest
+
+import main
+from scans.utils.helper import AssertException
+from scans.utils.store import ResultStore
+from scans.utils.shard import *
+
+
+def resource_scan(**kwargs):
+    return {
+        "id": "A1",
+        "name": "n",
+        "type": "az",
+        "applies_if_empty": "False",
+        "comment": "",
+        "duration": 1.0,
+        "started_at": 0.0,
+        "output_hash": None,
+        **kwargs,
+    }
+
+
+def partial(index, count, scans, plan="plan", subscription="sub", input_file="custom.csv"):
+    return {
+        "shard": [index, count],
+        "plan": plan,
+        "input": input_file,
+        "subscription": subscription,
+        "scans": scans,
+    }
+
+
+def expand(scan):
+    return [[f"sa{i}", "rg"] for i in range(10)] if scan["type"] == "az" else None
+
+
+def test_shard_plan_covers_every_unit_once():
+    objects = [
+        {"position": 0, "id": "O1", "type": "ps"},
+        {"position": 1, "id": "A1", "type": "az"},
+    ]
+    shards = [shard_plan(objects, expand, index, 3) for index in (1, 2, 3)]
+
+    assert len({plan for _, plan in shards}) == 1
+    whole = [scan["id"] for shard, _ in shards for scan in shard if "shard_indexes" not in scan]
+    indexes = sorted(i for shard, _ in shards for scan in shard for i in scan.get("shard_indexes", []))
+    assert whole == ["O1"]
+    assert indexes == list(range(10))
+    assert shards == [shard_plan(objects, expand, index, 3) for index in (1, 2, 3)]
+
+
+def test_merge_puts_resources_back_in_order():
+    first = resource_scan(
+        position=0,
+        status="True",
+        resources=[{"resource": "rg/sa2", "status": "True", "output_hash": "b", "index": 2}],
+    )
+    second = resource_scan(
+        position=0,
+        status="False",
+        resources=[
+            {"resource": "rg/sa0", "status": "False", "output_hash": "a", "index": 0},
+            {"resource": "rg/sa1", "status": "NotApplicable", "output_hash": "c", "index": 1},
+        ],
+    )
+
+    merged = merge_partials([partial(1, 2, [first]), partial(2, 2, [second])])
+
+    assert [r["resource"] for r in merged[0]["resources"]] == ["rg/sa0", "rg/sa1", "rg/sa2"]
+    assert merged[0]["status"] == "False"
+
+
+def test_merge_keeps_the_status_of_a_part_that_failed():
+    timed_out = resource_scan(position=0, status="NotApplicable", comment="Timed Out")
+    graded = resource_scan(
+        position=0,
+        status="True",
+        resources=[{"resource": "rg/sa0", "status": "True", "output_hash": "a", "index": 0}],
+    )
+
+    merged = merge_partials([partial(1, 2, [timed_out]), partial(2, 2, [graded])])
+
+    assert merged[0]["status"] == "NotApplicable"
+    assert merged[0]["comment"] == "Timed Out"
+
+
+def test_merge_requires_every_shard():
+    with pytest.raises(AssertException):
+        merge_partials([partial(1, 3, []), partial(3, 3, [])])
+
+
+
+def test_merge_requires_the_same_input_and_subscription():
+    with pytest.raises(AssertException):
+        merge_partials([partial(1, 2, []), partial(2, 2, [], input_file="other.csv")])
+    with pytest.raises(AssertException):
+        merge_partials([partial(1, 2, []), partial(2, 2, [], subscription="other")])
+
+
+def test_merged_run_is_stored_with_the_input_of_the_shards(tmp_path):
+    scan = resource_scan(position=0, id="O1", type="ps", status="True")
+    for index in (1, 2):
+        PartialResult(str(tmp_path / f"shard{index}.json"), False).write(
+            (index, 2), "plan", "custom.csv", "sub", [scan] if index == 1 else []
+        )
+
+    args = Namespace(
+        partial=[str(tmp_path / "shard1.json"), str(tmp_path / "shard2.json")],
+        db=str(tmp_path / "results.db"),
+        output=None,
+        input="audit_csv/ps.csv",
+        debug=False,
+    )
+    main.merge(args)
+
+    store = ResultStore(args.db, False)
+    assert store.baseline_run("custom.csv", "sub") is not None
+    assert store.baseline_run("audit_csv/ps.csv", "sub") is None
+    store.close()
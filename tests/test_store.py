@@ -0,0 +1,72 @@
+from scans.utils.store import *
+
+
+def scan(check_id, status, **kwargs):
+    return {"id": check_id, "name": check_id, "status": status, "comment": "", **kwargs}
+
+
+def add_run(store, statuses, started_at, subscription="sub", input_file="audit.csv"):
+    run_id = store.start_run(input_file, subscription)
+    for position, (check_id, status) in enumerate(statuses.items()):
+        store.add_check(
+            run_id, position, scan(check_id, status), None, 1.0, started_at, subscription
+        )
+    store.finish_run(run_id)
+    return run_id
+
+
+def test_fingerprint_ignores_colors_and_key_order():
+    assert fingerprint(b"\x1b[32mTrue\x1b[0m  \n") == fingerprint(b"True")
+    assert fingerprint({"a": 1, "b": 2}) == fingerprint({"b": 2, "a": 1})
+    assert fingerprint(None) is None
+
+
+def test_history_only_returns_status_changes(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    for hour, status in enumerate(["True", "True", "False", "False", "True"]):
+        add_run(store, {"A31": status, "A32": "True"}, hour * 3600)
+    add_run(store, {"A31": "False"}, 10 * 3600, subscription="other")
+
+    changes = store.history("A31", "sub")
+    assert [(c["started_at"], c["status"]) for c in changes] == [
+        (0, "True"),
+        (2 * 3600, "False"),
+        (4 * 3600, "True"),
+    ]
+    assert len(store.history("A31")) == 4
+    assert store.history("A31", "sub", since=3 * 3600)[0]["status"] == "False"
+    store.close()
+
+
+def test_run_results_keep_the_csv_order(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    run_id = add_run(store, {"O1": "True", "A1": "False", "A2": "NotApplicable"}, 0)
+
+    assert store.last_run() == run_id
+    assert [row["check_id"] for row in store.run_results(run_id)] == ["O1", "A1", "A2"]
+    store.close()
+
+
+def test_durations_average_the_last_runs(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    for hour, duration in enumerate([100.0, 2.0, 4.0]):
+        run_id = store.start_run("audit.csv", "sub")
+        store.add_check(run_id, 0, scan("A31", "True", command="a"), None, duration, hour, "sub")
+        store.finish_run(run_id)
+
+    assert store.durations(last_runs=2) == {("A31", "a"): 3.0}
+    store.close()
+
+
+def test_checks_sharing_an_id_have_their_own_timeline(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), False)
+    for hour in range(4):
+        run_id = store.start_run("ps.csv", "sub")
+        store.add_check(run_id, 2, scan("O12", "True", command="Get"), None, 1.0, hour, "sub")
+        store.add_check(run_id, 81, scan("O12", "False", command="Set"), None, 9.0, hour, "sub")
+        store.finish_run(run_id)
+
+    changes = store.history("O12", "sub")
+    assert [(c["position"], c["status"]) for c in changes] == [(2, "True"), (81, "False")]
+    assert store.durations() == {("O12", "Get"): 1.0, ("O12", "Set"): 9.0}
+    store.close()
@@ -0,0 +1,41 @@
+from scans.utils.table import ResourceTable
+
+
+def test_grade_each_resource():
+    table = ResourceTable(
+        ["rg/a", "rg/b", "rg/c", "rg/d"], [[True, True], [True, False], None, []]
+    )
+    assert table.grade("True", "False") == ["True", "False", "False", "NotApplicable"]
+    assert table.grade("True", "True") == ["True", "False", "False", "True"]
+
+
+def test_grade_special_checks():
+    table = ResourceTable(["rg/a", "rg/b"], [["x"], None])
+    assert table.grade("None", "False") == ["True", "True"]
+    assert table.grade("", "False") == ["False", "False"]
+
+
+def test_grade_regex():
+    table = ResourceTable(["rg/a", "rg/b"], ["TLS1_2", "TLS1_0"])
+    assert table.grade("regex TLS1_[23]", "False") == ["True", "False"]
+
+
+def test_aggregate():
+    assert ResourceTable.aggregate(["True", "NotApplicable"], "False") == "True"
+    assert ResourceTable.aggregate(["True", "False"], "False") == "False"
+    assert ResourceTable.aggregate(["NotApplicable"], "True") == "NotApplicable"
+    assert ResourceTable.aggregate([], "False") == "NotApplicable"
+    assert ResourceTable.aggregate([], "True") == "True"
+
+
+def test_failed_resources_are_errors():
+    table = ResourceTable(["rg/a", "rg/b", "rg/c"], [[True], None, [False]], [None, "Timed Out", None])
+    assert table.grade("True", "False") == ["True", "Error", "False"]
+    assert table.select([0, 1]).grade("None", "False") == ["True", "Error"]
+    assert ResourceTable.aggregate(["True", "Error"], "False") == "Error"
+    assert ResourceTable.aggregate(["False", "Error"], "False") == "False"
+
+
+def test_grade_looks_for_the_check_in_the_output():
+    table = ResourceTable(["rg/a", "rg/b"], [["minimumTlsVersion: TLS1_2"], ["TLS"]])
+    assert table.grade("TLS1_2", "False") == ["True", "False"]
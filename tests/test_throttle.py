@@ -0,0 +1,195 @@
+import asyncio
+import subprocess
+import threading
+
+import pytest
+
+from scans import SessionAZ, SessionPS
+from scans.utils.throttle import *
+
+
+def controller(**kwargs):
+    kwargs.setdefault("base_delay", 0.001)
+    return ThrottleController("test", **kwargs)
+
+
+def test_aimd_increase_and_decrease():
+    throttle = controller(max_concurrency=4)
+    assert throttle.limit == 2
+
+    for _ in range(10):
+        throttle.on_success()
+    assert throttle.limit == 4
+
+    throttle.on_throttle()
+    assert throttle.limit == 2
+    throttle.on_throttle()
+    throttle.on_throttle()
+    assert throttle.limit == 1
+
+
+def test_backoff_honours_retry_after():
+    throttle = controller(max_delay=5)
+    assert 3 <= throttle.backoff(0, 3) <= 3 + throttle.base_delay
+    assert throttle.backoff(0, 60) <= 5 + throttle.base_delay
+    assert 0 <= throttle.backoff(10) <= 5
+
+
+def test_run_retries_transient_errors():
+    throttle = controller()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ThrottledError("busy")
+        return "ok"
+
+    assert throttle.run(flaky) == "ok"
+    assert len(calls) == 3
+    assert throttle._in_flight == 0
+
+
+def test_run_gives_up_after_max_retries():
+    throttle = controller(max_retries=2)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise TransientError("down")
+
+    with pytest.raises(TransientError):
+        throttle.run(failing)
+    assert len(calls) == 3
+    assert throttle._in_flight == 0
+
+
+def test_run_passes_other_errors_through():
+    throttle = controller()
+
+    def broken():
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        throttle.run(broken)
+    assert throttle._in_flight == 0
+
+
+def test_arun_retries():
+    throttle = controller()
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ThrottledError("busy")
+        return 42
+
+    assert asyncio.run(throttle.arun(flaky)) == 42
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(2) == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_raise_for_status():
+    with pytest.raises(ThrottledError) as e:
+        raise_for_status(429, {"retry-after": "4"}, "busy")
+    assert e.value.retry_after == 4.0
+
+    with pytest.raises(TransientError):
+        raise_for_status(502, None, "bad gateway")
+
+    raise_for_status(404, None, "not found")
+    raise_for_status(None, None, "unknown")
+
+
+def test_az_errors_are_classified():
+    with pytest.raises(ThrottledError):
+        SessionAZ._raise_if_transient("ERROR: (TooManyRequests) Too many requests")
+    with pytest.raises(TransientError):
+        SessionAZ._raise_if_transient("ERROR: (GatewayTimeout) The gateway timed out")
+    SessionAZ._raise_if_transient("ERROR: (ResourceNotFound) Not found")
+
+
+def test_az_timeout_is_not_retried(monkeypatch):
+    def run(*args, **kwargs):
+        raise subprocess.TimeoutExpired(args[0], kwargs["timeout"])
+
+    monkeypatch.setattr(subprocess, "run", run)
+    session = SessionAZ(False)
+    session.throttle = controller()
+
+    with pytest.raises(Exception, match="Timed Out"):
+        session.run_cmd("account show")
+    assert session.throttle._in_flight == 0
+
+
+def test_ps_retry_after():
+    assert SessionPS._parse_retry_after(b"Server busy, retry after 1500 milliseconds") == 1.5
+    assert SessionPS._parse_retry_after(b"Try again in 3 seconds") == 3.0
+    assert SessionPS._parse_retry_after(b"nothing") is None
+
+
+def test_az_login_prompts_are_not_captured(monkeypatch):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(kwargs)
+        return subprocess.CompletedProcess(args[0], 0, b'[{"name": "sub"}]', None)
+
+    monkeypatch.setattr(subprocess, "run", run)
+    session = SessionAZ(False)
+    session.throttle = controller()
+
+    assert session.run_cmd("login", interactive=True) == [{"name": "sub"}]
+    assert session.run_cmd("account show") == [{"name": "sub"}]
+    assert calls[0]["stderr"] is None and calls[0]["timeout"] is None
+    assert calls[1]["stderr"] == subprocess.PIPE and calls[1]["timeout"] == 30
+
+
+def test_concurrent_throttles_lower_the_limit_once():
+    throttle = controller(max_concurrency=8)
+    for _ in range(50):
+        throttle.on_success()
+    assert throttle.limit == 8
+    generations = [throttle.acquire() for _ in range(8)]
+
+    # The 8 calls in flight are throttled by the same event
+    for generation in generations:
+        throttle.on_throttle(None, generation)
+        throttle.release()
+    assert throttle.limit == 4
+
+    # A call started after the decrease lowers it again
+    throttle.on_throttle(None, throttle.acquire())
+    throttle.release()
+    assert throttle.limit == 2
+
+
+def test_concurrent_throttles_in_run_lower_the_limit_once():
+    throttle = controller(max_concurrency=8)
+    for _ in range(50):
+        throttle.on_success()
+    barrier = threading.Barrier(8)
+    calls = []
+
+    def throttled_once():
+        calls.append(1)
+        if len(calls) <= 8:
+            barrier.wait()
+            raise ThrottledError("busy")
+        return "ok"
+
+    threads = [threading.Thread(target=throttle.run, args=(throttled_once,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 16
+    assert throttle.limit >= 4